@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
 import os
-import time
+import signal
 import argparse
 import csv
+import threading
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from itertools import islice
+import ijson
+import orjson
 import requests
-from typing import Dict, Any, List, Tuple, Optional, Iterable
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, List, Tuple, Optional, Iterable, Iterator, Callable
 
 
 def _raise_for_status_with_hint(r: requests.Response, where: str) -> None:
@@ -43,11 +51,78 @@ def iter_input_csv(path: str, smiles_col: str, id_col: Optional[str]) -> Iterabl
             yield qid, smi
 
 
-def load_processed_query_ids(out_path: str) -> set:
+def done_index_path(out_path: str) -> str:
+    # Sidecar with one finished query_id per line, appended as queries complete
+    return out_path + ".done"
+
+
+def read_done_index(done_path: str) -> Optional[set]:
+    # None when there is no sidecar (yet)
+    try:
+        with open(done_path, "r", encoding="utf-8") as f:
+            return set(f.read().splitlines())
+    except FileNotFoundError:
+        return None
+
+
+# Completed query_ids are appended to the sidecar in groups of this many, right after an output flush
+DONE_FLUSH_QUERIES = 100
+
+
+class DoneIndex:
+    """
+    Holds finished query_ids back until the rows they refer to have been flushed
+    from the output buffer, then appends them to the .done sidecar. A query_id in
+    the sidecar therefore never points at rows that were lost with the buffer.
+    flush_output=None means the output cannot be made durable piecewise (Parquet),
+    so nothing is recorded.
+    """
+
+    def __init__(self, fh, flush_output: Optional[Callable[[], None]], every: int = DONE_FLUSH_QUERIES):
+        self._fh = fh
+        self._flush_output = flush_output
+        self._every = every
+        self._pending: List[str] = []
+
+    def add(self, qid: str) -> None:
+        if self._flush_output is None:
+            return
+        self._pending.append(qid)
+        if len(self._pending) >= self._every:
+            self.commit()
+
+    def commit(self) -> None:
+        if not self._pending:
+            return
+        self._flush_output()
+        self._fh.writelines(qid + "\n" for qid in self._pending)
+        self._fh.flush()
+        self._pending.clear()
+
+
+def scan_output_query_ids(out_path: str, fmt: str = "csv") -> set:
+    """Full scan of a csv/ndjson output for its query_ids (only needed before a sidecar exists)."""
     processed = set()
-    if not os.path.exists(out_path):
+    if fmt == "ndjson":
+        try:
+            f = open(out_path, "rb", buffering=1 << 20)
+        except FileNotFoundError:
+            return processed
+        with f:
+            for line in f:
+                try:
+                    qid = str(orjson.loads(line).get("query_id") or "").strip()
+                except (orjson.JSONDecodeError, AttributeError):
+                    continue  # blank or cut-off last line
+                if qid:
+                    processed.add(qid)
+        return processed
+
+    try:
+        f = open(out_path, "r", encoding="utf-8-sig", newline="", buffering=1 << 20)
+    except FileNotFoundError:
         return processed
-    with open(out_path, "r", encoding="utf-8-sig", newline="") as f:
+    with f:
         reader = csv.DictReader(f)
         if not reader.fieldnames or "query_id" not in reader.fieldnames:
             return processed
@@ -58,113 +133,297 @@ def load_processed_query_ids(out_path: str) -> set:
     return processed
 
 
+OUTPUT_COLUMNS = ("query_id", "query_smiles", "hit_smiles", "hit_id", "similarity")
+OUTPUT_FORMATS = ("csv", "ndjson", "parquet")
+
+
 def write_csv_header_if_needed(writer: csv.writer, wrote_header: bool) -> bool:
     if not wrote_header:
-        writer.writerow(["query_id", "query_smiles", "hit_smiles", "hit_id", "similarity"])
+        writer.writerow(OUTPUT_COLUMNS)
         return True
     return wrote_header
 
 
-def parse_hits(payload: Any) -> List[Tuple[str, str, Optional[float]]]:
+class NdjsonRowWriter:
+    """csv.writer-like sink: one JSON object per line (binary file, orjson)."""
+
+    def __init__(self, f):
+        self._f = f
+
+    def writerows(self, rows: Iterable[tuple]) -> None:
+        self._f.write(b"".join(orjson.dumps(dict(zip(OUTPUT_COLUMNS, row))) + b"\n" for row in rows))
+
+
+class ParquetRowWriter:
     """
-    Supports typical CHEESE formats:
-      - {"neighbors":[{...}, ...]}
-      - {"smiles":[...], "id":[...]} (no score)
-    Returns: (hit_smiles, hit_id, score)
+    csv.writer-like sink for Parquet: rows are buffered column-wise and written
+    as row groups of row_group_size. similarity is stored as float32.
+    Needs pyarrow; a Parquet file cannot be appended to, so close() must be called.
     """
 
-    def pick_score(n: Dict[str, Any]) -> Optional[float]:
-        # Try many common keys. CHEESE can return either similarity or distance-like values.
-        candidates = [
-            # similarity-like (higher = more similar)
-            "similarity", "sim", "score",
-
-            # fingerprint / classic
-            "tanimoto", "morgan_tanimoto",
-
-            # shape / esp similarity
-            "shape_similarity", "shape_sim", "shape_tanimoto",
-            "espsim", "espsim_shape", "espsim_similarity", "espsim_sim",
-            "electrostatic_similarity", "esp_similarity", "esp_sim",
-
-            # embedding-based similarity
-            "cosine_similarity", "cos_sim", "cosine_sim",
-
-            # distance-like (lower = more similar, used only if nothing else exists)
-            "embedding_distance", "distance", "dist",
-            "espsim_distance", "shape_distance", "esp_distance",
-        ]
-
-        val = None
-        for k in candidates:
-            if k in n and n.get(k) is not None:
-                val = n.get(k)
-                break
-
-        # Sometimes score is nested
-        if val is None:
-            for k in ("metrics", "meta", "metadata"):
-                if isinstance(n.get(k), dict):
-                    d = n[k]
-                    for kk in candidates:
-                        if kk in d and d.get(kk) is not None:
-                            val = d.get(kk)
-                            break
+    def __init__(self, where, row_group_size: int = 100_000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema(
+            [(c, pa.string()) for c in OUTPUT_COLUMNS[:-1]] + [("similarity", pa.float32())]
+        )
+        self._writer = pq.ParquetWriter(where, self._schema)
+        self._row_group_size = row_group_size
+        self._cols: List[list] = [[] for _ in OUTPUT_COLUMNS]
+
+    def writerows(self, rows: Iterable[tuple]) -> None:
+        for row in rows:
+            for col, v in zip(self._cols, row):
+                col.append(v)
+        if len(self._cols[0]) >= self._row_group_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._cols[0]:
+            return
+        arrays = [self._pa.array(col, type=field.type) for col, field in zip(self._cols, self._schema)]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+        self._cols = [[] for _ in OUTPUT_COLUMNS]
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+@contextmanager
+def open_row_writer(path: str, fmt: str):
+    """
+    Yields (writer, had_rows, flush): an object with writerows(rows) for the chosen
+    --format, whether the output already had content, and a callable that pushes
+    buffered rows to the OS (None for parquet, which is only readable once closed).
+    csv/ndjson append to path; parquet must start a new file. The file is opened
+    once, no separate exists()/stat checks.
+    """
+    if fmt == "csv":
+        with open(path, "a", encoding="utf-8", newline="", buffering=1 << 20) as f:
+            had_rows = f.tell() > 0  # append mode starts at end of file
+            writer = csv.writer(f)
+            write_csv_header_if_needed(writer, had_rows)
+            yield writer, had_rows, f.flush
+    elif fmt == "ndjson":
+        with open(path, "ab", buffering=1 << 20) as f:
+            yield NdjsonRowWriter(f), f.tell() > 0, f.flush
+    elif fmt == "parquet":
+        try:
+            f = open(path, "xb")
+        except FileExistsError:
+            raise FileExistsError(
+                f"{path} exists and Parquet files cannot be appended to; use --overwrite or another --out."
+            ) from None
+        with f:
+            try:
+                writer = ParquetRowWriter(f)
+            except BaseException:
+                # don't leave an empty file behind that blocks the next run
+                f.close()
+                os.remove(path)
+                raise
+            try:
+                yield writer, False, None
+            finally:
+                writer.close()
+    else:
+        raise ValueError(f"Unknown output format {fmt!r}, expected one of {OUTPUT_FORMATS}")
+
+
+@contextmanager
+def open_done_sidecar(out_path: str, flush_output: Optional[Callable[[], None]]):
+    """
+    Yields the <out>.done file opened for appending, or None when the output
+    cannot be resumed (parquet, flush_output None), so no empty sidecar is left.
+    """
+    if flush_output is None:
+        yield None
+        return
+    with open(done_index_path(out_path), "a", encoding="utf-8") as fh:
+        yield fh
+
+
+# Score keys in priority order. CHEESE can return either similarity or distance-like values.
+CANDIDATES = (
+    # similarity-like (higher = more similar)
+    "similarity", "sim", "score",
+
+    # fingerprint / classic
+    "tanimoto", "morgan_tanimoto",
+
+    # shape / esp similarity
+    "shape_similarity", "shape_sim", "shape_tanimoto",
+    "espsim", "espsim_shape", "espsim_similarity", "espsim_sim",
+    "electrostatic_similarity", "esp_similarity", "esp_sim",
+
+    # embedding-based similarity
+    "cosine_similarity", "cos_sim", "cosine_sim",
+
+    # distance-like (lower = more similar, used only if nothing else exists)
+    "embedding_distance", "distance", "dist",
+    "espsim_distance", "shape_distance", "esp_distance",
+)
+# key -> rank (lower wins); .keys() doubles as the set of known score keys
+CANDIDATE_PRIORITY = {k: i for i, k in enumerate(CANDIDATES)}
+
+
+def _best_candidate(d: Dict[str, Any]) -> Any:
+    # single pass over the keys d shares with CANDIDATES, keep the best-ranked non-null one
+    best = min(
+        (CANDIDATE_PRIORITY[k] for k in CANDIDATE_PRIORITY.keys() & d.keys() if d[k] is not None),
+        default=None,
+    )
+    return None if best is None else d[CANDIDATES[best]]
+
+
+def pick_score(n: Dict[str, Any]) -> Optional[float]:
+    # Common case: plain "similarity" key, no set operations needed
+    val = n.get("similarity")
+    if val is None:
+        val = _best_candidate(n)
+
+    # Sometimes score is nested
+    if val is None:
+        for k in ("metrics", "meta", "metadata"):
+            d = n.get(k)
+            if isinstance(d, dict):
+                val = _best_candidate(d)
                 if val is not None:
                     break
 
-        if val is None:
-            return None
+    if val is None:
+        return None
+    if isinstance(val, (int, float)):
+        return float(val)
+
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+
+ID_KEYS = ("zinc_id", "id", "name", "identifier")
 
-        try:
-            return float(val)
-        except Exception:
-            return None
+
+def _neighbor_hit(n: Dict[str, Any]) -> Optional[Tuple[str, str, Optional[float]]]:
+    # first non-empty id key wins
+    for k in ID_KEYS:
+        v = n.get(k)
+        if v:
+            hit_id = str(v).strip().removesuffix("-DMCH")
+            break
+    else:
+        return None
+
+    # drop unusable rows before paying for the score lookup
+    if not hit_id or hit_id == "Query Molecule":
+        return None
+    hit_smiles = (n.get("smiles") or "").strip()
+    if not hit_smiles:
+        return None
+
+    return hit_smiles, hit_id, pick_score(n)
+
+
+def iter_hits(payload: Any) -> Iterator[Tuple[str, str, Optional[float]]]:
+    """
+    Supports typical CHEESE formats:
+      - {"neighbors":[{...}, ...]}
+      - {"smiles":[...], "id":[...]} (no score)
+    Yields: (hit_smiles, hit_id, score)
+    """
 
     if isinstance(payload, dict) and isinstance(payload.get("neighbors"), list):
-        out = []
         for n in payload["neighbors"]:
             if not isinstance(n, dict):
                 continue
+            hit = _neighbor_hit(n)
+            if hit is not None:
+                yield hit
+        return
 
-            hit_smiles = (n.get("smiles") or "").strip()
-            hit_id = str(n.get("zinc_id") or n.get("id") or n.get("name") or n.get("identifier") or "").strip()
-            hit_id = hit_id.replace("-DMCH", "")
+    if isinstance(payload, dict) and isinstance(payload.get("smiles"), list) and isinstance(payload.get("id"), list):
+        for smi, rid in zip(payload["smiles"], payload["id"]):
+            smi = str(smi).strip()
+            rid = str(rid).strip().removesuffix("-DMCH")
+            if smi and rid and rid != "Query Molecule":
+                yield smi, rid, None
 
-            score = pick_score(n)
 
-            if hit_smiles and hit_id and hit_id != "Query Molecule":
-                out.append((hit_smiles, hit_id, score))
-        return out
+def query_rows(qid: str, qsmiles: str, hits: Iterable[Tuple[str, str, Optional[float]]], n: int) -> List[tuple]:
+    # Output rows for one query, capped at n; consumes hits lazily (stops early)
+    return list(islice(((qid, qsmiles, hs, hi, sim) for hs, hi, sim in hits), n))
 
-    if isinstance(payload, dict) and isinstance(payload.get("smiles"), list) and isinstance(payload.get("id"), list):
-        out = []
-        n = min(len(payload["smiles"]), len(payload["id"]))
-        for i in range(n):
-            smi = str(payload["smiles"][i]).strip()
-            rid = str(payload["id"][i]).strip().replace("-DMCH", "")
-            if smi and rid and rid != "Query Molecule":
-                out.append((smi, rid, None))
-        return out
 
-    return []
+class _HeadRecorder:
+    """
+    File-like wrapper that keeps a copy of everything read until stop() is called.
+    Lets iter_hits_streaming fall back to a full parse when the body turns out not
+    to be the {"neighbors": [...]} shape it streams.
+    """
+
+    def __init__(self, raw):
+        self._raw = raw
+        self.chunks: Optional[List[bytes]] = []
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._raw.read(size)
+        if self.chunks is not None:
+            self.chunks.append(data)
+        return data
+
+    def stop(self) -> None:
+        self.chunks = None
+
+
+def iter_hits_streaming(r: requests.Response) -> Iterator[Tuple[str, str, Optional[float]]]:
+    """
+    Same as iter_hits, but for a single-query response opened with stream=True:
+    {"neighbors": [...]} is parsed (ijson's C backend) while the body is still
+    downloading, so the caller can stop reading once it has n hits.
+    Any other shape (a one-element list wrapper, the {"smiles":[...], "id":[...]}
+    columns) is read in full and handed to iter_hits.
+    """
+    r.raw.decode_content = True  # let urllib3 undo gzip/deflate
+    body = _HeadRecorder(r.raw)
+
+    streamed = False
+    for n in ijson.items(body, "neighbors.item", use_float=True):
+        if not streamed:
+            streamed = True
+            body.stop()  # it is the neighbors shape: no need to keep the bytes any more
+        if isinstance(n, dict):
+            hit = _neighbor_hit(n)
+            if hit is not None:
+                yield hit
+    if streamed:
+        return
+
+    payload = orjson.loads(b"".join(body.chunks) + r.raw.read())
+    if isinstance(payload, list) and len(payload) == 1:
+        payload = payload[0]
+    yield from iter_hits(payload)
+
 
 def call_batch_search(
-    api_url: str,
-    headers: Dict[str, str],
+    session: requests.Session,
+    url: str,
     smiles_list: List[str],
     db_name: str,
     n_neighbors: int,
     search_type: str,
     search_quality: str,
     timeout: int,
-) -> Any:
+) -> requests.Response:
     """
-    GET /batch_search
+    GET /batch_search (url is the full endpoint URL)
     Trik: některé implementace berou list parametrů jako opakované query paramy.
     requests to umí přes list values.
+    Returns the response opened with stream=True (body not read yet); caller closes it.
     """
-    url = f"{api_url.rstrip('/')}/batch_search"
     params = {
         "search_input": smiles_list,          # repeated query param
         "search_type": search_type,
@@ -172,14 +431,14 @@ def call_batch_search(
         "db_names": db_name,
         "n_neighbors": int(n_neighbors),
     }
-    r = requests.get(url, params=params, headers=headers, timeout=timeout)
+    r = session.get(url, params=params, timeout=timeout, stream=True)
     _raise_for_status_with_hint(r, where="batch_search")
-    return r.json()
+    return r
 
 
 def call_molsearch(
-    api_url: str,
-    headers: Dict[str, str],
+    session: requests.Session,
+    url: str,
     smiles: str,
     db_name: str,
     n_neighbors: int,
@@ -187,7 +446,6 @@ def call_molsearch(
     search_quality: str,
     timeout: int,
 ) -> Any:
-    url = f"{api_url.rstrip('/')}/molsearch"
     params = {
         "search_input": smiles,
         "search_type": search_type,
@@ -195,13 +453,178 @@ def call_molsearch(
         "db_names": [db_name],
         "n_neighbors": int(n_neighbors),
     }
-    r = requests.get(url, params=params, headers=headers, timeout=timeout)
+    r = session.get(url, params=params, timeout=timeout)
     _raise_for_status_with_hint(r, where="molsearch")
-    return r.json()
+    return orjson.loads(r.content)
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit, AIMD-style as in TCP congestion control:
+    the limit grows by 1/limit per successful call and is halved on overload
+    (429/5xx), so the number of requests in flight settles just below what
+    the server accepts.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        with self._cond:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def on_overload(self) -> None:
+        with self._cond:
+            self.limit = max(self.min_limit, self.limit * 0.5)
+            print(f"[WARN] server overloaded, concurrency limit -> {int(self.limit)}")
+
+
+@contextmanager
+def _limited(limiter: AIMDLimiter):
+    """Holds one limiter slot for the body of the with block and reports 429/5xx as overload."""
+    limiter.acquire()
+    try:
+        yield
+    except requests.HTTPError as e:
+        code = getattr(e.response, "status_code", None)
+        if code is not None and (code == 429 or code >= 500):
+            limiter.on_overload()
+        raise
+    else:
+        limiter.on_success()
+    finally:
+        limiter.release()
+
+
+def _call_limited(limiter: AIMDLimiter, fn, **kwargs) -> Any:
+    with _limited(limiter):
+        return fn(**kwargs)
+
+
+def _exit_on_sigterm(signum, frame) -> None:
+    # Unwind normally so open files get flushed and closed
+    raise SystemExit(128 + signum)
+
+
+def _do_batch(
+    batch: List[Tuple[str, str]],
+    batch_search: Callable[..., requests.Response],
+    molsearch: Callable[..., Any],
+    limiter: AIMDLimiter,
+    args: argparse.Namespace,
+    stop: threading.Event,
+) -> List[Tuple[str, List[tuple]]]:
+    """
+    Runs one batch (with retries) in a worker thread.
+    Returns [(query_id, rows), ...] with at most n rows per query; writing is left to the caller.
+    Retries only re-send the queries that have not completed yet; whatever still fails
+    after that is reported and left out of the result.
+    batch_search / molsearch are call_batch_search / call_molsearch with everything
+    but the SMILES already bound. Once stop is set (Ctrl+C / SIGTERM in the main thread)
+    no new request, retry or sleep is started and the partial result is returned.
+    """
+    n, no_batch = args.n, args.no_batch
+    # per-item log
+    for qid, smi in batch:
+        print(f"[RUN] query_id={qid} | smiles={smi}")
+
+    def molsearch_rows(qid: str, qsmiles: str) -> List[tuple]:
+        payload = _call_limited(limiter, molsearch, smiles=qsmiles)
+        return query_rows(qid, qsmiles, iter_hits(payload), n)
+
+    results: List[Tuple[str, List[tuple]]] = []
+    completed = set()
+    remaining = batch
+
+    last_err: Optional[Exception] = None
+    for attempt in range(args.retries + 1):
+        if stop.is_set():
+            return results
+        try:
+            if not no_batch:
+                # call /batch_search
+                smiles_list = [s for _, s in remaining]
+                # keep the slot until the streamed body has been read, not just the headers
+                with _limited(limiter), batch_search(smiles_list=smiles_list) as r:
+                    if len(remaining) == 1:
+                        # Single query: parse while downloading, stop once n hits are in
+                        qid, qsmiles = remaining[0]
+                        results.append((qid, query_rows(qid, qsmiles, iter_hits_streaming(r), n)))
+                        completed.add(qid)
+                    else:
+                        payload = orjson.loads(r.content)
+
+                        # Expected: list of results aligned with smiles_list OR dict with results
+                        # We handle both:
+                        if isinstance(payload, list) and len(payload) == len(remaining):
+                            for (qid, qsmiles), one in zip(remaining, payload):
+                                results.append((qid, query_rows(qid, qsmiles, iter_hits(one), n)))
+                                completed.add(qid)
+                        else:
+                            # Fallback: treat as single payload applied to first query,
+                            # the others go through /molsearch below
+                            qid, qsmiles = remaining[0]
+                            results.append((qid, query_rows(qid, qsmiles, iter_hits(payload), n)))
+                            completed.add(qid)
+
+            else:
+                # per query /molsearch
+                for qid, qsmiles in remaining:
+                    if stop.is_set():
+                        return results
+                    results.append((qid, molsearch_rows(qid, qsmiles)))
+                    completed.add(qid)
+
+            remaining = [b for b in remaining if b[0] not in completed]
+            last_err = None
+            break
+
+        except Exception as e:
+            last_err = e
+            remaining = [b for b in remaining if b[0] not in completed]
+            sleep_t = 1.0 + 1.5 * attempt
+            print(f"[WARN] batch attempt={attempt+1} failed ({type(e).__name__}): {e}; "
+                  f"{len(remaining)} queries left, sleeping {sleep_t:.1f}s")
+            stop.wait(sleep_t)
+
+    # Last resort for a batch endpoint that keeps failing: one /molsearch call per leftover query
+    if remaining and not no_batch:
+        for qid, qsmiles in remaining:
+            if stop.is_set():
+                return results
+            try:
+                results.append((qid, molsearch_rows(qid, qsmiles)))
+                completed.add(qid)
+            except Exception as e:
+                last_err = e
+
+    for qid, _ in remaining:
+        if qid not in completed:
+            print(f"[ERROR] query_id={qid} failed after retries: {last_err}")
+
+    if args.sleep_between > 0:
+        stop.wait(args.sleep_between)
+    return results
 
 
 def main():
-    p = argparse.ArgumentParser(description="CHEESE batch_search/molsearch: CSV -> N nearest -> output CSV")
+    p = argparse.ArgumentParser(description="CHEESE batch_search/molsearch: CSV -> N nearest -> output CSV/NDJSON/Parquet")
 
     p.add_argument("--api-url", default=os.getenv("CHEESE_API_URL", "https://api.cheese.deepmedchem.com"))
     p.add_argument("--api-key", default=os.getenv("CHEESE_API_KEY", ""), help="X-API-Key (or set CHEESE_API_KEY)")
@@ -217,12 +640,22 @@ def main():
     p.add_argument("--timeout", type=int, default=180)
 
     p.add_argument("--out", default="molsearch_results.csv")
-    p.add_argument("--resume", action="store_true")
+    p.add_argument("--format", choices=OUTPUT_FORMATS, default="csv",
+                   help="Output format; parquet needs pyarrow and cannot append to an existing file, so no --resume")
+    p.add_argument("--resume", action="store_true",
+                   help="Skip query_ids already recorded in <out>.done (csv and ndjson only)")
     p.add_argument("--overwrite", action="store_true")
 
-    p.add_argument("--sleep-between", type=float, default=0.2)
+    p.add_argument("--sleep-between", type=float, default=0.0,
+                   help="Extra fixed pause after each batch (normally not needed, the adaptive limiter paces requests)")
     p.add_argument("--retries", type=int, default=2)
 
+    # concurrency knobs (AIMD: grow on success, halve on 429/5xx)
+    p.add_argument("--concurrency", type=int, default=16, help="Worker threads (upper bound for requests in flight)")
+    p.add_argument("--initial-concurrency", type=int, default=4)
+    p.add_argument("--min-concurrency", type=int, default=1)
+    p.add_argument("--max-concurrency", type=int, default=None, help="Defaults to --concurrency")
+
     # batch knobs
     p.add_argument("--batch-size", type=int, default=1, help="How many queries per /batch_search call (start with 1)")
     p.add_argument("--no-batch", action="store_true", help="Force per-query /molsearch instead of /batch_search")
@@ -231,102 +664,118 @@ def main():
 
     if not args.api_key:
         raise SystemExit("Missing --api-key (or set CHEESE_API_KEY env var).")
+    if args.resume and args.format == "parquet":
+        raise SystemExit("--resume needs --format csv or ndjson: a Parquet file cannot be appended to.")
+    if args.format == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401  (ParquetRowWriter imports it lazily)
+        except ImportError:
+            raise SystemExit("--format parquet needs pyarrow: pip install pyarrow")
 
     headers = {"X-API-Key": args.api_key, "accept": "application/json"}
 
-    if args.overwrite and os.path.exists(args.out):
-        os.remove(args.out)
-
-    processed = load_processed_query_ids(args.out) if args.resume else set()
-    wrote_header = os.path.exists(args.out) and not args.overwrite
-
-    items = [(qid, smi) for (qid, smi) in iter_input_csv(args.input_csv, args.smiles_col, args.id_col)]
-    if args.resume:
-        items = [(qid, smi) for (qid, smi) in items if qid not in processed]
+    # One keep-alive session for the whole run (no TCP/TLS handshake per query)
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0))
+    session.headers.update(headers)
+    # neighbor lists are repetitive JSON and compress well; ask for it explicitly
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+
+    # Per-run constants bound once, so the hot path only passes SMILES
+    api_url = args.api_url.rstrip("/")
+    search_kwargs = dict(
+        session=session,
+        db_name=args.db_name,
+        n_neighbors=args.n,
+        search_type=args.search_type,
+        search_quality=args.search_quality,
+        timeout=args.timeout,
+    )
+    batch_search = partial(call_batch_search, url=f"{api_url}/batch_search", **search_kwargs)
+    molsearch = partial(call_molsearch, url=f"{api_url}/molsearch", **search_kwargs)
+
+    done_path = done_index_path(args.out)
+    if args.overwrite:
+        for path in (args.out, done_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    processed = read_done_index(done_path) if args.resume else None
 
     os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
-    with open(args.out, "a", encoding="utf-8", newline="") as f_out:
-        writer = csv.writer(f_out)
-        wrote_header = write_csv_header_if_needed(writer, wrote_header)
-
-        i = 0
-        while i < len(items):
-            batch = items[i : i + max(1, args.batch_size)]
-            i += len(batch)
-
-            # per-item log
-            for qid, smi in batch:
-                print(f"[RUN] query_id={qid} | smiles={smi}")
-
-            last_err: Optional[Exception] = None
-            for attempt in range(args.retries + 1):
-                try:
-                    if not args.no_batch and len(batch) > 0:
-                        # call /batch_search
-                        smiles_list = [s for _, s in batch]
-                        payload = call_batch_search(
-                            api_url=args.api_url,
-                            headers=headers,
-                            smiles_list=smiles_list,
-                            db_name=args.db_name,
-                            n_neighbors=args.n,
-                            search_type=args.search_type,
-                            search_quality=args.search_quality,
-                            timeout=args.timeout,
-                        )
-
-                        # Expected: list of results aligned with smiles_list OR dict with results
-                        # We handle both:
-                        if isinstance(payload, list) and len(payload) == len(batch):
-                            for (qid, qsmiles), one in zip(batch, payload):
-                                hits = parse_hits(one)
-                                for hit_smiles, hit_id, sim in hits[: args.n]:
-                                    writer.writerow([qid, qsmiles, hit_smiles, hit_id, sim])
-                                processed.add(qid)
-                                print(f"[OK] query_id={qid} hits={len(hits)} -> appended")
-                        else:
-                            # Fallback: treat as single payload applied to first query
-                            qid, qsmiles = batch[0]
-                            hits = parse_hits(payload)
-                            for hit_smiles, hit_id, sim in hits[: args.n]:
-                                writer.writerow([qid, qsmiles, hit_smiles, hit_id, sim])
-                            processed.add(qid)
-                            print(f"[OK] query_id={qid} hits={len(hits)} -> appended")
-
-                    else:
-                        # per query /molsearch
-                        for qid, qsmiles in batch:
-                            payload = call_molsearch(
-                                api_url=args.api_url,
-                                headers=headers,
-                                smiles=qsmiles,
-                                db_name=args.db_name,
-                                n_neighbors=args.n,
-                                search_type=args.search_type,
-                                search_quality=args.search_quality,
-                                timeout=args.timeout,
-                            )
-                            hits = parse_hits(payload)
-                            for hit_smiles, hit_id, sim in hits[: args.n]:
-                                writer.writerow([qid, qsmiles, hit_smiles, hit_id, sim])
-                            processed.add(qid)
-                            print(f"[OK] query_id={qid} hits={len(hits)} -> appended")
-
-                    f_out.flush()
-                    last_err = None
-                    break
-
-                except Exception as e:
-                    last_err = e
-                    sleep_t = 1.0 + 1.5 * attempt
-                    print(f"[WARN] batch attempt={attempt+1} failed ({type(e).__name__}): {e}; sleeping {sleep_t:.1f}s")
-                    time.sleep(sleep_t)
-
-            if last_err is not None:
-                print(f"[ERROR] batch failed after retries: {last_err}")
-
-            if args.sleep_between > 0:
-                time.sleep(args.sleep_between)
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+    # Output is buffered; DoneIndex flushes it before recording query_ids (also on SIGTERM / Ctrl+C)
+    with open_row_writer(args.out, args.format) as (writer, had_rows, flush_output), \
+            open_done_sidecar(args.out, flush_output) as done_fh:
+        if not had_rows:
+            # New output, or one deleted while its sidecar was kept: nothing in the sidecar is on disk
+            processed = set()
+            if done_fh is not None:
+                done_fh.truncate(0)
+        elif done_fh.tell() == 0:
+            # Output written before the sidecar existed: index it once so later resumes skip the scan
+            seed = scan_output_query_ids(args.out, args.format)
+            done_fh.writelines(qid + "\n" for qid in seed)
+            if args.resume:
+                processed = seed
+        processed = processed or set()
+        done_index = DoneIndex(done_fh, flush_output)
+
+        # Streamed, never materialized: memory stays O(concurrency), not O(rows)
+        work_iter = (
+            (qid, smi)
+            for qid, smi in iter_input_csv(args.input_csv, args.smiles_col, args.id_col)
+            if qid not in processed
+        )
+
+        max_concurrency = min(args.max_concurrency or args.concurrency, args.concurrency)
+        limiter = AIMDLimiter(args.initial_concurrency, args.min_concurrency, max_concurrency)
+
+        batch_size = max(1, args.batch_size)
+        max_pending = 2 * limiter.max_limit
+        stop = threading.Event()  # tells running _do_batch calls to give up early
+
+        # Network-bound: overlap requests across worker threads, but keep all
+        # output writes on this thread (the row writers are not thread-safe).
+        with ThreadPoolExecutor(max_workers=limiter.max_limit) as executor:
+            pending = set()
+            exhausted = False
+            try:
+                while True:
+                    # keep at most max_pending batches submitted
+                    while not exhausted and len(pending) < max_pending:
+                        batch = list(islice(work_iter, batch_size))
+                        if not batch:
+                            exhausted = True
+                            break
+                        pending.add(executor.submit(_do_batch, batch, batch_search, molsearch, limiter, args, stop))
+                    if not pending:
+                        break
+
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        try:
+                            results = fut.result()
+                        except Exception as e:
+                            print(f"[ERROR] {e}")
+                            continue
+
+                        for qid, rows in results:
+                            writer.writerows(rows)
+                            done_index.add(qid)
+                            print(f"[OK] query_id={qid} hits={len(rows)} -> appended")
+            except BaseException:
+                # SIGTERM / Ctrl+C: drop queued batches and stop retrying running ones,
+                # so the executor's exit only waits for requests already in flight
+                stop.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            finally:
+                # Whatever was written so far: flush it, then record its query_ids
+                done_index.commit()
 
     print(f"[DONE] Output written to: {args.out}")
 
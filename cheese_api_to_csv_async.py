@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+import os
+import asyncio
+import argparse
+import aiohttp
+import orjson
+from typing import Dict, Any, List, Tuple, Optional
+
+from cheese_api_to_csv import (
+    DoneIndex,
+    done_index_path,
+    iter_hits,
+    iter_input_csv,
+    open_done_sidecar,
+    open_row_writer,
+    query_rows,
+    read_done_index,
+    scan_output_query_ids,
+    OUTPUT_FORMATS,
+)
+
+
+async def _raise_for_status_with_hint(r: aiohttp.ClientResponse, where: str) -> None:
+    if r.status < 400:
+        return
+    code = r.status
+    body = (await r.text())[:800]
+    hint = ""
+    if code in (401, 403):
+        hint = " (auth error: check X-API-Key and host)"
+    elif code == 422:
+        hint = " (validation error: check param names/types)"
+    elif code == 429:
+        hint = " (rate limit: slow down / backoff)"
+    raise aiohttp.ClientResponseError(
+        r.request_info, r.history, status=code, message=f"{where} HTTP {code}{hint}: {body}"
+    )
+
+
+async def fetch_one(
+    session: aiohttp.ClientSession,
+    url: str,
+    qid: str,
+    smiles: str,
+    db_name: str,
+    n_neighbors: int,
+    search_type: str,
+    search_quality: str,
+    retries: int,
+) -> Tuple[str, str, Any]:
+    """
+    GET /molsearch for one query, with retries.
+    Returns (query_id, query_smiles, payload).
+    """
+    # aiohttp wants repeated query params as (key, value) pairs
+    params = [
+        ("search_input", smiles),
+        ("search_type", search_type),
+        ("search_quality", search_quality),
+        ("db_names", db_name),
+        ("n_neighbors", str(int(n_neighbors))),
+    ]
+    last_err: Optional[Exception] = None
+    for attempt in range(retries + 1):
+        try:
+            async with session.get(url, params=params) as r:
+                await _raise_for_status_with_hint(r, where="molsearch")
+                return qid, smiles, orjson.loads(await r.read())
+        except Exception as e:
+            last_err = e
+            sleep_t = 1.0 + 1.5 * attempt
+            print(f"[WARN] query_id={qid} attempt={attempt+1} failed ({type(e).__name__}): {e}; sleeping {sleep_t:.1f}s")
+            await asyncio.sleep(sleep_t)
+    raise RuntimeError(f"query_id={qid} failed after retries: {last_err}") from last_err
+
+
+async def write_results(queue: asyncio.Queue, writer, done: DoneIndex, n: int) -> None:
+    """
+    Single consumer: the only coroutine touching the output files.
+    Queue items are (qid, qsmiles, payload); None ends the stream.
+    """
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            qid, qsmiles, payload = item
+            rows = query_rows(qid, qsmiles, iter_hits(payload), n)
+            writer.writerows(rows)
+            done.add(qid)
+            print(f"[OK] query_id={qid} hits={len(rows)} -> appended")
+    finally:
+        # Also on cancellation: flush what was written, then record its query_ids
+        done.commit()
+
+
+async def run(args: argparse.Namespace, headers: Dict[str, str], processed: Optional[set]) -> None:
+    url = f"{args.api_url.rstrip('/')}/molsearch"
+    concurrency = max(1, args.concurrency)
+
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    sem = asyncio.Semaphore(concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2 * concurrency)
+
+    async def one(session: aiohttp.ClientSession, qid: str, smi: str) -> None:
+        try:
+            result = await fetch_one(
+                session=session,
+                url=url,
+                qid=qid,
+                smiles=smi,
+                db_name=args.db_name,
+                n_neighbors=args.n,
+                search_type=args.search_type,
+                search_quality=args.search_quality,
+                retries=args.retries,
+            )
+            await queue.put(result)
+        except Exception as e:
+            print(f"[ERROR] {e}")
+        finally:
+            sem.release()
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open_row_writer(args.out, args.format) as (writer, had_rows, flush_output), \
+            open_done_sidecar(args.out, flush_output) as done_fh:
+        if not had_rows:
+            # New output, or one deleted while its sidecar was kept: nothing in the sidecar is on disk
+            processed = set()
+            if done_fh is not None:
+                done_fh.truncate(0)
+        elif done_fh.tell() == 0:
+            # Output written before the sidecar existed: index it once so later resumes skip the scan
+            seed = scan_output_query_ids(args.out, args.format)
+            done_fh.writelines(qid + "\n" for qid in seed)
+            if args.resume:
+                processed = seed
+        processed = processed or set()
+
+        consumer = asyncio.create_task(write_results(queue, writer, DoneIndex(done_fh, flush_output), args.n))
+
+        try:
+            async with aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout) as session:
+                tasks: List[asyncio.Task] = []
+                for qid, smi in iter_input_csv(args.input_csv, args.smiles_col, args.id_col):
+                    if qid in processed:
+                        continue
+                    # Acquire before creating the task, so at most `concurrency` are alive
+                    await sem.acquire()
+                    print(f"[RUN] query_id={qid} | smiles={smi}")
+                    tasks.append(asyncio.create_task(one(session, qid, smi)))
+                    tasks = [t for t in tasks if not t.done()]
+                await asyncio.gather(*tasks)
+
+            await queue.put(None)
+            await consumer
+        finally:
+            # Error or Ctrl+C: let the writer record what it has while the files are still open
+            if not consumer.done():
+                consumer.cancel()
+                await asyncio.gather(consumer, return_exceptions=True)
+
+
+def main():
+    p = argparse.ArgumentParser(description="CHEESE molsearch (asyncio/aiohttp): CSV -> N nearest -> output CSV/NDJSON/Parquet")
+
+    p.add_argument("--api-url", default=os.getenv("CHEESE_API_URL", "https://api.cheese.deepmedchem.com"))
+    p.add_argument("--api-key", default=os.getenv("CHEESE_API_KEY", ""), help="X-API-Key (or set CHEESE_API_KEY)")
+
+    p.add_argument("--db-name", default="CHEMSPACE-10B-RO5")
+    p.add_argument("--input-csv", required=True)
+    p.add_argument("--smiles-col", default="smiles")
+    p.add_argument("--id-col", default=None)
+
+    p.add_argument("--n", type=int, default=10000)
+    p.add_argument("--search-type", default="espsim_shape")
+    p.add_argument("--search-quality", default="fast")
+    p.add_argument("--timeout", type=int, default=180)
+
+    p.add_argument("--out", default="molsearch_results.csv")
+    p.add_argument("--format", choices=OUTPUT_FORMATS, default="csv",
+                   help="Output format; parquet needs pyarrow and cannot append to an existing file, so no --resume")
+    p.add_argument("--resume", action="store_true",
+                   help="Skip query_ids already recorded in <out>.done (csv and ndjson only)")
+    p.add_argument("--overwrite", action="store_true")
+
+    p.add_argument("--retries", type=int, default=2)
+    p.add_argument("--concurrency", type=int, default=16, help="Requests in flight on the event loop")
+
+    args = p.parse_args()
+
+    if not args.api_key:
+        raise SystemExit("Missing --api-key (or set CHEESE_API_KEY env var).")
+    if args.resume and args.format == "parquet":
+        raise SystemExit("--resume needs --format csv or ndjson: a Parquet file cannot be appended to.")
+    if args.format == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401  (ParquetRowWriter imports it lazily)
+        except ImportError:
+            raise SystemExit("--format parquet needs pyarrow: pip install pyarrow")
+
+    headers = {"X-API-Key": args.api_key, "accept": "application/json"}
+
+    done_path = done_index_path(args.out)
+    if args.overwrite:
+        for path in (args.out, done_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    processed = read_done_index(done_path) if args.resume else None
+    asyncio.run(run(args, headers, processed))
+
+    print(f"[DONE] Output written to: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
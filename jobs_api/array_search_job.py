@@ -5,6 +5,8 @@ import os
 from typing import List,Optional,Dict,Any
 import time
 import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from utils import submit_molsearch,get_job_status,get_molsearch_page
 
 API_KEY="Your API Key" 
@@ -24,6 +26,9 @@ PROP_RANGES={
 ### Database name
 DB_NAME="ZINC15"
 
+### Give up waiting for a job after this many seconds
+MAX_WAIT_SEC=3600
+
 
 ## Prepare data structure for final molecules
 FINAL_MOLECULES={}
@@ -38,14 +43,26 @@ for k,query in enumerate(INPUT_MOLECULES):
                     API_KEY=API_KEY)
 
 
-    # Step 2 : Wait for its completion 
-
-    job_status=get_job_status(job_name,API_KEY=API_KEY)
-
-    while job_status!="SUCCESS":
+    # Step 2 : Wait for its completion (poll with exponential backoff, capped at 30s, for at most MAX_WAIT_SEC)
+    deadline=time.monotonic()+MAX_WAIT_SEC
+    delay=0.2
+    while True:
+        try:
+            job_status=get_job_status(job_name,API_KEY=API_KEY)
+        except (requests.ConnectionError,requests.Timeout) as e:
+            job_status=f"unreachable ({type(e).__name__})"  # transient error, keep polling
+        except requests.HTTPError as e:
+            code=e.response.status_code if e.response is not None else None
+            if code is None or not (code==429 or code>=500):
+                raise  # bad API key, unknown job, ...: polling again will not fix it
+            job_status=f"unavailable (HTTP {code})"
+        if job_status=="SUCCESS":
+            break
+        if time.monotonic()>=deadline:
+            raise TimeoutError(f"Job {job_name} not finished after {MAX_WAIT_SEC}s (last status: {job_status})")
         print(f"Job is {job_status} Waiting...")
-        time.sleep(1)
-        job_status=get_job_status(job_name,API_KEY=API_KEY)
+        time.sleep(delay)
+        delay=min(delay*1.5,30.0)
 
     print(f"Job is completed")
 
@@ -56,22 +73,23 @@ for k,query in enumerate(INPUT_MOLECULES):
     FINAL_MOLECULES[query]={}
 
     print("Extracting filtered properties (will take approximately 3 mins)...")
-    for page_num in range(100):
-        if page_num%20==0:
-            print(f"Progress {page_num}%")
-        page=get_molsearch_page(job_name=job_name,
-                                db_name=DB_NAME,
-                                page_size=1000,
-                                page_num=page_num,
-                                prop_ranges=PROP_RANGES,
-                                sim_th=SIM_TH,
-                                API_KEY=API_KEY)
-        filtered_idx=[i for i in range(len(page["in_prop_range"])) if page["in_prop_range"][i]]
-        for key,values in page.items():
-            if key in FINAL_MOLECULES[query]:
-                FINAL_MOLECULES[query][key]+=[values[i] for i in filtered_idx]
-            else:
-                FINAL_MOLECULES[query][key]=[values[i] for i in filtered_idx]
+    # Pages are independent requests: fetch them in parallel, merge them in order
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        pages=ex.map(lambda p: get_molsearch_page(job_name=job_name,
+                                                  db_name=DB_NAME,
+                                                  page_size=1000,
+                                                  page_num=p,
+                                                  prop_ranges=PROP_RANGES,
+                                                  sim_th=SIM_TH,
+                                                  API_KEY=API_KEY),
+                     range(100))
+        for page_num,page in enumerate(pages):
+            if page_num%20==0:
+                print(f"Progress {page_num}%")
+            # Boolean mask over each column (numpy loop instead of per-index Python lookups)
+            mask=np.asarray(page["in_prop_range"],dtype=bool)
+            for key,values in page.items():
+                FINAL_MOLECULES[query].setdefault(key,[]).extend(np.asarray(values,dtype=object)[mask].tolist())
 
 
 ## Step 5 : Save the results as JSON
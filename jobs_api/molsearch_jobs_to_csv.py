@@ -3,6 +3,7 @@ import os
 import time
 import argparse
 import csv
+import orjson
 import requests
 from typing import Dict, Any, List, Tuple, Optional, Iterable
 
@@ -133,7 +134,7 @@ def get_molsearch_page(
     r = requests.post(url, params=params, json={"prop_ranges": {}},
                       headers={**headers, "Content-Type": "application/json"}, timeout=timeout)
     _raise_for_status_with_hint(r, where="get_molsearch_page")
-    return r.json()
+    return orjson.loads(r.content)
 
 
 def wait_for_job(
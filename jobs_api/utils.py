@@ -1,6 +1,8 @@
 ##### This is an example of job API search for an array of molecules #####
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import os
 from typing import List,Optional,Dict,Any
 import time
@@ -8,6 +10,22 @@ import json
 
 CHEESE_URL="https://api.cheese.deepmedchem.com"
 
+_SESSION: Optional[requests.Session] = None
+
+
+def get_session() -> requests.Session:
+    """
+    Shared keep-alive session (created on first use), so consecutive calls
+    reuse pooled connections instead of doing a new TCP/TLS handshake each time.
+    """
+    global _SESSION
+    if _SESSION is None:
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0))
+        session.headers["Accept-Encoding"] = "gzip, deflate"  # result pages compress well
+        _SESSION = session
+    return _SESSION
+
 
 def submit_molsearch(
     search_input: str,
@@ -34,7 +52,7 @@ def submit_molsearch(
         "db_names": db_names
     }
 
-    response = requests.get(url, headers=headers, params=params)
+    response = get_session().get(url, headers=headers, params=params)
     response.raise_for_status()  # raises if 4xx/5xx
 
     job_name=response.json()
@@ -57,7 +75,7 @@ def get_job_status(job_name:str,
     params = {
         "job_name": job_name
     }
-    response = requests.get(url, headers=headers, params=params)
+    response = get_session().get(url, headers=headers, params=params)
     response.raise_for_status()  # raises if 4xx/5xx
 
     status=response.json()
@@ -103,7 +121,7 @@ def get_molsearch_page(
         "prop_ranges": prop_ranges or {}
     }
 
-    response = requests.post(
+    response = get_session().post(
         url,
         headers=headers,
         params=params,
@@ -111,4 +129,4 @@ def get_molsearch_page(
     )
     response.raise_for_status()
 
-    return response.json()
+    return orjson.loads(response.content)
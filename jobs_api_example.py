@@ -1,14 +1,37 @@
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import os
 from typing import List,Optional,Dict,Any
 import time
 import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 API_KEY="Your CHEESE API Key here" 
 
 
 CHEESE_URL="https://api.cheese.deepmedchem.com"
 
+_SESSION: Optional[requests.Session] = None
+
+
+def get_session() -> requests.Session:
+    """
+    Shared keep-alive session (created on first use), so consecutive calls and the
+    parallel page fetches below reuse pooled connections instead of a new TCP/TLS handshake each.
+    """
+    global _SESSION
+    if _SESSION is None:
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0))
+        session.headers["Accept-Encoding"] = "gzip, deflate"  # result pages compress well
+        _SESSION = session
+    return _SESSION
+
+### Give up waiting for a job after this many seconds
+MAX_WAIT_SEC=3600
+
 
 def submit_molsearch(
     search_input: str,
@@ -34,7 +57,7 @@ def submit_molsearch(
         "db_names": db_names
     }
 
-    response = requests.get(url, headers=headers, params=params)
+    response = get_session().get(url, headers=headers, params=params)
     response.raise_for_status()  # raises if 4xx/5xx
 
     job_name=response.json()
@@ -56,7 +79,7 @@ def get_job_status(job_name:str):
     params = {
         "job_name": job_name
     }
-    response = requests.get(url, headers=headers, params=params)
+    response = get_session().get(url, headers=headers, params=params)
     response.raise_for_status()  # raises if 4xx/5xx
 
     status=response.json()
@@ -101,7 +124,7 @@ def get_molsearch_page(
         "prop_ranges": prop_ranges or {}
     }
 
-    response = requests.post(
+    response = get_session().post(
         url,
         headers=headers,
         params=params,
@@ -109,7 +132,7 @@ def get_molsearch_page(
     )
     response.raise_for_status()
 
-    return response.json()
+    return orjson.loads(response.content)
 
 
 
@@ -122,14 +145,26 @@ job_name=submit_molsearch(search_input="CCCC",
                 db_names=["ZINC15"])
 
 
-# Step 2 : Wait for its completion 
-
-job_status=get_job_status(job_name)
-
-while job_status!="SUCCESS":
+# Step 2 : Wait for its completion (poll with exponential backoff, capped at 30s, for at most MAX_WAIT_SEC)
+deadline=time.monotonic()+MAX_WAIT_SEC
+delay=0.2
+while True:
+    try:
+        job_status=get_job_status(job_name)
+    except (requests.ConnectionError,requests.Timeout) as e:
+        job_status=f"unreachable ({type(e).__name__})"  # transient error, keep polling
+    except requests.HTTPError as e:
+        code=e.response.status_code if e.response is not None else None
+        if code is None or not (code==429 or code>=500):
+            raise  # bad API key, unknown job, ...: polling again will not fix it
+        job_status=f"unavailable (HTTP {code})"
+    if job_status=="SUCCESS":
+        break
+    if time.monotonic()>=deadline:
+        raise TimeoutError(f"Job {job_name} not finished after {MAX_WAIT_SEC}s (last status: {job_status})")
     print(f"Job is {job_status} Waiting...")
-    time.sleep(1)
-    job_status=get_job_status(job_name)
+    time.sleep(delay)
+    delay=min(delay*1.5,30.0)
 
 print(f"Job is completed")
 
@@ -151,23 +186,22 @@ db_name="ZINC15"
 filtered_molecules={}
 
 print("Extracting filtered properties...")
-for page_num in range(100):
-    if page_num%10==0:
-        print(f"Progress {page_num}%")
-    page=get_molsearch_page(job_name=job_name,
-                            db_name=db_name,
-                            page_size=1000,
-                            page_num=page_num,
-                            prop_ranges=prop_ranges)
-
-    filtered_idx=[i for i in range(len(page["in_prop_range"])) if page["in_prop_range"][i]]
-    
-    for key,values in page.items():
-        if key in filtered_molecules:
-            filtered_molecules[key]+=[values[i] for i in filtered_idx]
-        else:
-            filtered_molecules[key]=[values[i] for i in filtered_idx]
-    break
+# Pages are independent requests: fetch them in parallel, merge them in order
+with ThreadPoolExecutor(max_workers=16) as ex:
+    pages=ex.map(lambda p: get_molsearch_page(job_name=job_name,
+                                              db_name=db_name,
+                                              page_size=1000,
+                                              page_num=p,
+                                              prop_ranges=prop_ranges),
+                 range(100))
+    for page_num,page in enumerate(pages):
+        if page_num%10==0:
+            print(f"Progress {page_num}%")
+
+        # Boolean mask over each column (numpy loop instead of per-index Python lookups)
+        mask=np.asarray(page["in_prop_range"],dtype=bool)
+        for key,values in page.items():
+            filtered_molecules.setdefault(key,[]).extend(np.asarray(values,dtype=object)[mask].tolist())
 
 
 ## Step 5 : Save the results as JSON
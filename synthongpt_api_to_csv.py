@@ -1,16 +1,93 @@
 # %%
 #!/usr/bin/env python3
+import io
 import os
+import signal
 import time
+import asyncio
+import random
 import argparse
 import csv
-import requests
-from typing import Dict, Any, List, Tuple, Optional, Iterable
+from collections import deque
+from functools import partial
+import httpx
+import numpy as np
+import orjson
+from typing import Dict, Any, List, Tuple, Optional, Iterable, Deque, AsyncIterator
 
+# Transient HTTP failures retried by _post
+RETRY_TOTAL = 5
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
-def submit_synthongpt_job(
-    api_url: str,
-    headers: Dict[str, str],
+# Hits handed to the writer per queue item
+WRITE_BATCH = 1024
+
+# Output is flushed (and completed queries recorded in .done) after this much text or this many queries
+FLUSH_BYTES = 4 << 20
+FLUSH_QUERIES = 100
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every request: refills at `rps` tokens/sec and
+    holds at most one second's worth, so concurrent queries can't burst
+    past the API's per-second cap after a quiet spell.
+    """
+
+    def __init__(self, rps: float):
+        self.rate = float(rps)
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.ts = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
+async def _post(
+    client: httpx.AsyncClient,
+    url: str,
+    params: Dict[str, Any],
+    where: str,
+    timeout: int,
+) -> httpx.Response:
+    """
+    POST with query params + empty JSON body {}.
+    Retries transport errors and RETRY_STATUSES with exponential backoff
+    (honouring a numeric Retry-After), then hands the last response to
+    _raise_for_status_with_hint.
+    """
+    for attempt in range(RETRY_TOTAL + 1):
+        r: Optional[httpx.Response] = None
+        try:
+            r = await client.post(url, params=params, json={}, timeout=timeout)
+        except httpx.TransportError:
+            if attempt == RETRY_TOTAL:
+                raise
+        else:
+            if r.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+                _raise_for_status_with_hint(r, where=where)
+                return r
+
+        sleep_t = RETRY_BACKOFF * (2 ** attempt)
+        retry_after = r.headers.get("Retry-After", "") if r is not None else ""
+        if retry_after.isdigit():
+            sleep_t = float(retry_after)
+        await asyncio.sleep(sleep_t)
+    raise AssertionError("unreachable")
+
+
+async def submit_synthongpt_job(
+    client: httpx.AsyncClient,
+    url: str,
     smiles: str,
     db_name: str,
     search_quality: str,
@@ -23,7 +100,6 @@ def submit_synthongpt_job(
     Uses query params + empty JSON body {}.
     Returns job_id/job_name (string).
     """
-    url = f"{api_url.rstrip('/')}/submit_synthongpt_job"
     params = {
         "search_input": smiles,
         "db_name": db_name,
@@ -31,8 +107,7 @@ def submit_synthongpt_job(
         "include_metadata": str(include_metadata).lower(),
         "search_quality": search_quality,
     }
-    r = requests.post(url, params=params, json={}, headers=headers, timeout=timeout)
-    _raise_for_status_with_hint(r, where="submit_synthongpt_job")
+    r = await _post(client, url, params, where="submit_synthongpt_job", timeout=timeout)
 
     # Robust parsing of job id/name
     try:
@@ -55,147 +130,197 @@ def submit_synthongpt_job(
     raise RuntimeError(f"Unexpected submit response shape: {js!r}")
 
 
-def get_molsearch_page(
-    api_url: str,
-    headers: Dict[str, str],
-    job_name: str,
-    page_num: int,
-    page_size: int,
-    db_name: str,
-    db_name_as_list: bool = True,
-    timeout: int = 60,
-) -> Dict[str, Any]:
+def page_params(job_name: str, page_size: int, db_name: str, db_name_as_list: bool = True) -> Dict[str, Any]:
     """
-    Fetch one results page via POST /get_molsearch_page.
+    The /get_molsearch_page params that stay fixed across a job's pages.
     Some deployments want db_name as list, others as scalar. Controlled via db_name_as_list.
     """
-    url = f"{api_url.rstrip('/')}/get_molsearch_page"
-    params: Dict[str, Any] = {
+    return {
         "job_name": job_name,
-        "page_num": page_num,
         "page_size": page_size,
         "db_name": [db_name] if db_name_as_list else db_name,
     }
-    r = requests.post(url, params=params, json={}, headers=headers, timeout=timeout)
-    _raise_for_status_with_hint(r, where="get_molsearch_page")
-    return r.json()
 
 
-def wait_until_results_available(
-    api_url: str,
-    headers: Dict[str, str],
+async def get_molsearch_page(
+    client: httpx.AsyncClient,
+    url: str,
+    base_params: Dict[str, Any],
+    page_num: int,
+    timeout: int = 60,
+) -> Dict[str, Any]:
+    """
+    Fetch one results page via POST /get_molsearch_page.
+    base_params comes from page_params(), built once per job.
+    """
+    params = {**base_params, "page_num": page_num}
+    r = await _post(client, url, params, where="get_molsearch_page", timeout=timeout)
+    return orjson.loads(r.content)
+
+
+async def wait_until_results_available(
+    client: httpx.AsyncClient,
+    page_url: str,
     job_name: str,
     db_name: str,
-    page_size: int,
     poll_sec: float,
     max_wait_sec: int,
     db_name_as_list: bool = True,
     timeout: int = 60,
+    max_sleep: float = 8.0,
 ) -> None:
     """
     Reliable waiting: probe page 0 until it returns a non-empty list.
-    Does NOT rely on /job_status.
+    Does NOT rely on /job_status. The probe asks for a single row, so each
+    poll stays cheap regardless of the paging size used for the download.
+    Polls with decorrelated jitter so concurrent queries don't poll in lockstep.
     """
-    start = time.time()
-    attempt = 0
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    prev_sleep = poll_sec
+    probe_params = page_params(job_name, 1, db_name, db_name_as_list)
 
     while True:
-        attempt += 1
+        retry_after: Optional[float] = None
         try:
-            page0 = get_molsearch_page(
-                api_url=api_url,
-                headers=headers,
-                job_name=job_name,
+            page0 = await get_molsearch_page(
+                client=client,
+                url=page_url,
+                base_params=probe_params,
                 page_num=0,
-                page_size=page_size,
-                db_name=db_name,
-                db_name_as_list=db_name_as_list,
                 timeout=timeout,
             )
             ids = page0.get("id", []) or []
             if isinstance(ids, list) and len(ids) > 0:
                 return
-        except requests.HTTPError as e:
-            code = getattr(e.response, "status_code", None)
+        except httpx.HTTPStatusError as e:
+            code = e.response.status_code
             # auth/validation issues should fail fast
             if code in (401, 403, 422):
                 raise
+            if code in (429, 503):
+                try:
+                    retry_after = float(e.response.headers.get("Retry-After", ""))
+                except ValueError:
+                    pass
             # otherwise treat as "still processing"
         except Exception:
             pass
 
-        if time.time() - start > max_wait_sec:
+        if loop.time() - start > max_wait_sec:
             raise TimeoutError(f"Timeout waiting for results for job={job_name} after {max_wait_sec}s")
 
-        # gentle backoff (max 10s)
-        sleep_t = min(10.0, poll_sec * (1.0 + 0.15 * min(attempt, 20)))
-        time.sleep(sleep_t)
+        # decorrelated jitter: grows ~1.5x per poll up to max_sleep, unless the server said how long
+        if retry_after is not None:
+            sleep_t = retry_after
+        else:
+            sleep_t = random.uniform(poll_sec, min(max_sleep, prev_sleep * 1.5))
+            prev_sleep = sleep_t
+        await asyncio.sleep(sleep_t)
+
+
+def _parse_similarities(values: List[Any]) -> List[Optional[float]]:
+    """
+    Coerce a page's similarity column to floats in one numpy pass.
+    Falls back per element (None for anything not float-convertible) when the
+    column has gaps or junk, which numpy would reject or turn into NaN.
+    """
+    try:
+        arr = np.asarray(values, dtype=np.float64)
+        if arr.ndim == 1 and not np.isnan(arr).any():
+            return arr.tolist()
+    except (TypeError, ValueError):
+        pass
+
+    # JSON only yields float/int/bool/str/None/containers here, so type checks
+    # replace try/except except for strings, which may not parse
+    out: List[Optional[float]] = []
+    for v in values:
+        if isinstance(v, float):
+            out.append(v)
+        elif isinstance(v, int):
+            out.append(float(v))
+        elif isinstance(v, str) and v:
+            try:
+                out.append(float(v))
+            except ValueError:
+                out.append(None)
+        else:
+            out.append(None)
+    return out
 
 
-def iter_results_paged(
-    api_url: str,
-    headers: Dict[str, str],
+async def iter_results_paged(
+    client: httpx.AsyncClient,
+    page_url: str,
     job_name: str,
     db_name: str,
     total_needed: int,
     page_size: int,
     db_name_as_list: bool = True,
     timeout: int = 60,
-) -> List[Tuple[str, str, Optional[float]]]:
+    prefetch: int = 2,
+) -> AsyncIterator[Tuple[str, str, Optional[float]]]:
     """
-    Returns list of (hit_smiles, hit_id, similarity).
+    Yields (hit_smiles, hit_id, similarity) as pages arrive.
     Downloads up to total_needed hits.
+    Up to `prefetch` pages are fetched ahead as tasks, so the next page is
+    on the wire while the current one is being parsed.
     """
-    out: List[Tuple[str, str, Optional[float]]] = []
-    page_num = 0
-
-    while len(out) < total_needed:
-        ## Progress log
-        if page_num == 0:
-            print(f"Fetching results page {page_num} (up to {total_needed} total hits)...")
-        elif page_num % 10 == 0:
-            print(f"Fetching results page {page_num} (collected {len(out)}/{total_needed} hits so far)...")
-        page = get_molsearch_page(
-            api_url=api_url,
-            headers=headers,
-            job_name=job_name,
-            page_num=page_num,
-            page_size=page_size,
-            db_name=db_name,
-            db_name_as_list=db_name_as_list,
-            timeout=timeout,
-        )
-        smiles_list = page.get("smiles", []) or []
-        id_list = page.get("id", []) or []
-        sim_list = page.get("similarity", []) or []
-
-        n = min(len(smiles_list), len(id_list), len(sim_list))
-        if n == 0:
-            break
-
-        for i in range(n):
-            rid = id_list[i]
-            if rid == "Query Molecule":
-                continue
+    collected = 0
+    fetch = partial(
+        get_molsearch_page,
+        client=client,
+        url=page_url,
+        base_params=page_params(job_name, page_size, db_name, db_name_as_list),
+        timeout=timeout,
+    )
+    depth = max(1, prefetch)
+    pending: Deque[asyncio.Task] = deque()
+    next_page = 0
 
-            hit_smiles = smiles_list[i]
-            hit_id = str(rid).strip().replace("-DMCH", "")
+    try:
+        while collected < total_needed:
+            # Top up the in-flight pages, but never past what total_needed can still use
+            while len(pending) < depth and collected + len(pending) * page_size < total_needed:
+                ## Progress log
+                if next_page == 0:
+                    print(f"Fetching results page {next_page} (up to {total_needed} total hits)...")
+                elif next_page % 10 == 0:
+                    print(f"Fetching results page {next_page} (collected {collected}/{total_needed} hits so far)...")
+                pending.append(asyncio.create_task(fetch(page_num=next_page)))
+                next_page += 1
+            if not pending:
+                break
 
-            try:
-                sim: Optional[float] = float(sim_list[i])
-            except Exception:
-                sim = None
+            page = await pending.popleft()
+            smiles_list = page.get("smiles", []) or []
+            id_list = page.get("id", []) or []
+            sim_list = page.get("similarity", []) or []
 
-            out.append((hit_smiles, hit_id, sim))
-            if len(out) >= total_needed:
+            n = min(len(smiles_list), len(id_list), len(sim_list))
+            if n == 0:
                 break
 
-        if n < page_size:
-            break
+            id_list = id_list[:n]
+            hit_ids = [(rid if type(rid) is str else str(rid)).strip().removesuffix("-DMCH") for rid in id_list]
+            sims = _parse_similarities(sim_list[:n])
 
-        page_num += 1
+            for hit_smiles, rid, hit_id, sim in zip(smiles_list, id_list, hit_ids, sims):
+                if rid == "Query Molecule":
+                    continue
 
-    return out
+                yield hit_smiles, hit_id, sim
+                collected += 1
+                if collected >= total_needed:
+                    break
+
+            if n < page_size:
+                break
+    finally:
+        # Early exit (enough hits, short page or error): drop pages still in flight
+        for fut in pending:
+            fut.cancel()
 
 
 def write_csv_header_if_needed(writer: csv.writer, wrote_header: bool) -> bool:
@@ -205,9 +330,10 @@ def write_csv_header_if_needed(writer: csv.writer, wrote_header: bool) -> bool:
     return wrote_header
 
 
-def process_one_query(
-    api_url: str,
-    headers: Dict[str, str],
+async def process_one_query(
+    client: httpx.AsyncClient,
+    submit_url: str,
+    page_url: str,
     query_id: str,
     smiles: str,
     db_name: str,
@@ -219,47 +345,72 @@ def process_one_query(
     include_metadata: bool,
     db_name_as_list: bool,
     timeout: int,
-) -> List[Tuple[str, str, Optional[float]]]:
-    job_name = submit_synthongpt_job(
-        api_url=api_url,
-        headers=headers,
-        smiles=smiles,
-        db_name=db_name,
-        search_quality=str(n),
-        include_properties=include_properties,
-        include_metadata=include_metadata,
-        timeout=timeout,
-    )
-    wait_until_results_available(
-        api_url=api_url,
-        headers=headers,
-        job_name=job_name,
-        db_name=db_name,
-        page_size=page_size,
-        poll_sec=poll_sec,
-        max_wait_sec=max_wait_sec,
-        db_name_as_list=db_name_as_list,
-        timeout=timeout,
-    )
-
-    rows = iter_results_paged(
-        api_url=api_url,
-        headers=headers,
+    submitted: Optional[Dict[Tuple[str, str, str], asyncio.Future]] = None,
+) -> AsyncIterator[Tuple[str, str, Optional[float]]]:
+    """
+    Yields hits for one query. With `submitted`, jobs are shared per
+    (smiles, db_name, search_quality): a repeated query reuses the first
+    one's ready job (or waits on it if still running) instead of submitting again.
+    """
+    async def submit_and_wait() -> str:
+        job_name = await submit_synthongpt_job(
+            client=client,
+            url=submit_url,
+            smiles=smiles,
+            db_name=db_name,
+            search_quality=str(n),
+            include_properties=include_properties,
+            include_metadata=include_metadata,
+            timeout=timeout,
+        )
+        await wait_until_results_available(
+            client=client,
+            page_url=page_url,
+            job_name=job_name,
+            db_name=db_name,
+            poll_sec=poll_sec,
+            max_wait_sec=max_wait_sec,
+            db_name_as_list=db_name_as_list,
+            timeout=timeout,
+        )
+        return job_name
+
+    if submitted is None:
+        job_name = await submit_and_wait()
+    else:
+        key = (smiles, db_name, str(n))
+        job = submitted.get(key)
+        if job is None:
+            job = submitted[key] = asyncio.ensure_future(submit_and_wait())
+        try:
+            job_name = await asyncio.shield(job)
+        except Exception:
+            # Don't pin a failed job: a later duplicate gets a fresh submission
+            if submitted.get(key) is job:
+                del submitted[key]
+            raise
+
+    async for row in iter_results_paged(
+        client=client,
+        page_url=page_url,
         job_name=job_name,
         db_name=db_name,
         total_needed=n,
         page_size=page_size,
         db_name_as_list=db_name_as_list,
         timeout=timeout,
-    )
-    return rows
+    ):
+        yield row
 
 
-def iter_input_csv(path: str, smiles_col: str, id_col: Optional[str]) -> Iterable[Tuple[str, str]]:
+def iter_input_csv(
+    path: str, smiles_col: str, id_col: Optional[str], skip: Optional[set] = None
+) -> Iterable[Tuple[str, str]]:
     """
     Yields (query_id, smiles) from input CSV.
     - smiles_col: name of column containing SMILES
     - id_col: optional column name for ID; if None, uses row index starting at 1
+    - skip: query_ids to pass over (e.g. already in output); checked before the SMILES is touched
     """
     with open(path, "r", encoding="utf-8-sig", newline="") as f:
         reader = csv.DictReader(f)
@@ -273,23 +424,58 @@ def iter_input_csv(path: str, smiles_col: str, id_col: Optional[str]) -> Iterabl
             raise ValueError(f"ID column '{id_col}' not found. Available: {reader.fieldnames}")
 
         for idx, row in enumerate(reader, start=1):
-            smiles = (row.get(smiles_col) or "").strip()
-            if not smiles:
-                continue
             qid = (row.get(id_col) or "").strip() if id_col else str(idx)
             if not qid:
                 qid = str(idx)
+            if skip and qid in skip:
+                print(f"[SKIP] query_id={qid} already in output")
+                continue
+            smiles = (row.get(smiles_col) or "").strip()
+            if not smiles:
+                continue
             yield qid, smiles
 
 
+def done_index_path(out_path: str) -> str:
+    """Sidecar next to the output CSV: one completed query_id per line."""
+    return out_path + ".done"
+
+
 def load_processed_query_ids(out_path: str) -> set:
     """
-    For --resume: reads existing output CSV and returns set of query_id already present.
+    For --resume: the query_ids listed in the .done sidecar (empty if there is none).
+    _run checks them against the output: a missing/empty output discards them,
+    and an output without sidecar entries is scanned instead.
+    """
+    try:
+        with open(done_index_path(out_path), "r", encoding="utf-8") as f:
+            return set(f.read().splitlines())
+    except FileNotFoundError:
+        return set()
+
+
+def scan_output_query_ids(out_path: str) -> set:
+    """
+    Reads existing output CSV and returns set of query_id already present.
     """
     processed = set()
     if not os.path.exists(out_path):
         return processed
 
+    # Fast path: pandas' C parser reads just the query_id column
+    try:
+        import pandas as pd
+
+        col = pd.read_csv(
+            out_path, usecols=["query_id"], dtype=str, engine="c", encoding="utf-8-sig", na_filter=False
+        )["query_id"]
+        processed = set(col.str.strip().to_numpy())
+        processed.discard("")
+        return processed
+    except (ImportError, ValueError):
+        # no pandas, or no header / no query_id column: take the csv module path
+        processed = set()
+
     with open(out_path, "r", encoding="utf-8-sig", newline="") as f:
         reader = csv.DictReader(f)
         if not reader.fieldnames:
@@ -303,10 +489,10 @@ def load_processed_query_ids(out_path: str) -> set:
     return processed
 
 
-def _raise_for_status_with_hint(r: requests.Response, where: str) -> None:
+def _raise_for_status_with_hint(r: httpx.Response, where: str) -> None:
     try:
         r.raise_for_status()
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         code = r.status_code
         body = (r.text or "")[:600]
         hint = ""
@@ -314,7 +500,207 @@ def _raise_for_status_with_hint(r: requests.Response, where: str) -> None:
             hint = " (auth error: check X-API-Key and host)"
         elif code == 422:
             hint = " (validation error: check param names/types; try toggling --db-name-as-list)"
-        raise requests.HTTPError(f"{where} HTTP {code}{hint}: {body}", response=r) from e
+        raise httpx.HTTPStatusError(f"{where} HTTP {code}{hint}: {body}", request=r.request, response=r) from e
+
+
+def format_rows_fast(qid: str, smiles: str, hits: List[Tuple[str, str, Optional[float]]]) -> Optional[str]:
+    """
+    Render hit rows as CSV text with a plain join, the way csv.writer would
+    (\r\n line ends, None as an empty field). Returns None when any field
+    would need quoting (a comma, quote or line break), so the caller can
+    fall back to csv.writer for that batch.
+    """
+    prefix = f"{qid},{smiles},"
+    body = "".join([
+        f"{prefix}{'' if hit_smiles is None else hit_smiles},{hit_id},{'' if sim is None else sim}\r\n"
+        for hit_smiles, hit_id, sim in hits
+    ])
+    n = len(hits)
+    if '"' in body or body.count(",") != 4 * n or body.count("\n") != n or body.count("\r") != n:
+        return None
+    return body
+
+
+def format_rows_csv(qid: str, smiles: str, hits: List[Tuple[str, str, Optional[float]]]) -> str:
+    """Same as format_rows_fast, through csv.writer, for batches that need quoting."""
+    buf = io.StringIO()
+    csv.writer(buf).writerows([qid, smiles, hit_smiles, hit_id, sim] for hit_smiles, hit_id, sim in hits)
+    return buf.getvalue()
+
+
+async def write_results(queue: asyncio.Queue, f_out, done_f, processed: set) -> None:
+    """
+    Single consumer: the only coroutine touching the output CSV.
+    Queue items are (qid, smiles, hits) with up to WRITE_BATCH hits. They are
+    formatted as they arrive but held per query (at most --n rows) until
+    hits=None marks the query as complete, then written in one piece, so a
+    query's rows stay contiguous and a failed query (hits=False) leaves no
+    partial rows behind for --resume to duplicate. None ends the stream.
+    The output is flushed every FLUSH_BYTES / FLUSH_QUERIES rather than per
+    query; completed queries go to the .done sidecar only after the flush
+    that covers their rows, so --resume never skips a query with rows lost.
+    """
+    pending: Dict[str, List[str]] = {}
+    counts: Dict[str, int] = {}
+    completed: List[str] = []
+    unflushed = 0
+
+    def flush() -> None:
+        nonlocal unflushed
+        f_out.flush()
+        if completed:
+            done_f.writelines(qid + "\n" for qid in completed)
+            done_f.flush()
+            completed.clear()
+        unflushed = 0
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            qid, smiles, hits = item
+            if hits:
+                body = format_rows_fast(qid, smiles, hits)
+                if body is None:
+                    body = format_rows_csv(qid, smiles, hits)
+                pending.setdefault(qid, []).append(body)
+                counts[qid] = counts.get(qid, 0) + len(hits)
+                continue
+            bodies = pending.pop(qid, [])
+            if hits is False:
+                counts.pop(qid, None)
+                continue
+            for body in bodies:
+                f_out.write(body)
+                unflushed += len(body)
+            completed.append(qid)
+            processed.add(qid)
+            print(f"[OK] query_id={qid} hits={counts.pop(qid, 0)} -> appended")
+
+            if unflushed >= FLUSH_BYTES or len(completed) >= FLUSH_QUERIES:
+                flush()
+    finally:
+        # Also on cancellation / SIGTERM: everything completed so far is buffered, so record it
+        flush()
+
+
+def _exit_on_sigterm(signum, frame) -> None:
+    # Unwind normally so the writer's final flush runs and open files get closed
+    raise SystemExit(128 + signum)
+
+
+async def _run(args: argparse.Namespace, headers: Dict[str, str], processed: set) -> None:
+    concurrency = max(1, args.concurrency)
+    base_url = args.api_url.rstrip("/")
+    submit_url = f"{base_url}/submit_synthongpt_job"
+    page_url = f"{base_url}/get_molsearch_page"
+    # Bounded, so the input CSV is read only a little ahead of the workers
+    work: asyncio.Queue = asyncio.Queue(maxsize=2 * concurrency)
+    queue: asyncio.Queue = asyncio.Queue()
+    submitted: Dict[Tuple[str, str, str], asyncio.Future] = {}
+
+    async def producer() -> None:
+        skip = processed if args.resume else None
+        for qid, smiles in iter_input_csv(args.input_csv, args.smiles_col, args.id_col, skip=skip):
+            await work.put((qid, smiles))
+        # One stop marker per worker
+        for _ in range(concurrency):
+            await work.put(None)
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        while (item := await work.get()) is not None:
+            qid, smiles = item
+            print(f"[RUN] query_id={qid} | smiles={smiles}")
+            await one(client, qid, smiles)
+
+    async def one(client: httpx.AsyncClient, qid: str, smiles: str) -> None:
+        try:
+            batch: List[Tuple[str, str, Optional[float]]] = []
+            async for hit in process_one_query(
+                client=client,
+                submit_url=submit_url,
+                page_url=page_url,
+                query_id=qid,
+                smiles=smiles,
+                db_name=args.db_name,
+                n=args.n,
+                page_size=args.page_size,
+                poll_sec=args.poll_sec,
+                max_wait_sec=args.max_wait_sec,
+                include_properties=args.include_properties,
+                include_metadata=args.include_metadata,
+                db_name_as_list=args.db_name_as_list,
+                timeout=args.timeout,
+                submitted=submitted,
+            ):
+                batch.append(hit)
+                if len(batch) >= WRITE_BATCH:
+                    await queue.put((qid, smiles, batch))
+                    batch = []
+            if batch:
+                await queue.put((qid, smiles, batch))
+            await queue.put((qid, smiles, None))
+        except Exception as e:
+            print(f"[ERROR] query_id={qid} failed: {e}")
+            await queue.put((qid, smiles, False))  # drop the rows it already sent
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    # 1 MB binary buffer under the text layer; write_results decides when to flush
+    with open(done_index_path(args.out), "a", encoding="utf-8") as done_f, \
+            io.TextIOWrapper(open(args.out, "ab", buffering=1 << 20), encoding="utf-8", newline="") as f_out:
+        wrote_header = f_out.buffer.tell() > 0  # append mode starts at end of file
+        if not wrote_header:
+            # New output, or one deleted while its sidecar was kept: nothing in the sidecar is on disk
+            processed.clear()
+            done_f.truncate(0)
+        elif done_f.tell() == 0:
+            # Output written before the sidecar existed: index it once so later resumes skip the scan
+            seed = scan_output_query_ids(args.out)
+            done_f.writelines(qid + "\n" for qid in seed)
+            if args.resume:
+                processed.update(seed)
+        write_csv_header_if_needed(csv.writer(f_out), wrote_header)
+        consumer = asyncio.create_task(write_results(queue, f_out, done_f, processed))
+
+        # One client for all calls. Over HTTP/2 queries and prefetched pages multiplex on one
+        # connection; the pool is sized for the HTTP/1.1 fallback (one per in-flight page).
+        limits = httpx.Limits(max_connections=2 * concurrency, max_keepalive_connections=concurrency)
+        event_hooks: Dict[str, list] = {}
+        if args.rps > 0:
+            limiter = RateLimiter(args.rps)
+
+            async def throttle(request: httpx.Request) -> None:
+                await limiter.acquire()
+
+            # Request hooks run before every send, retries included
+            event_hooks["request"] = [throttle]
+        try:
+            async with httpx.AsyncClient(
+                http2=not args.no_http2,
+                limits=limits,
+                headers=headers,
+                timeout=args.timeout,
+                event_hooks=event_hooks,
+                follow_redirects=True,  # like requests did, e.g. an http:// --api-url answered with a redirect to https
+            ) as client:
+                workers = [asyncio.create_task(worker(client)) for _ in range(concurrency)]
+                try:
+                    await producer()
+                    await asyncio.gather(*workers)
+                finally:
+                    # Input error or Ctrl+C: stop the workers rather than leave them waiting on the queue
+                    for w in workers:
+                        w.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+
+            await queue.put(None)
+            await consumer
+        finally:
+            # Error or Ctrl+C: the writer's final flush must run while f_out / done_f are still open
+            if not consumer.done():
+                consumer.cancel()
+                await asyncio.gather(consumer, return_exceptions=True)
 
 
 def main():
@@ -345,61 +731,31 @@ def main():
         action="store_true",
         help="Send db_name as list on /get_molsearch_page. If you get 422, try toggling this on/off.",
     )
+    p.add_argument("--concurrency", type=int, default=8, help="Queries processed concurrently")
+    p.add_argument("--rps", type=float, default=0.0, help="Max API requests per second across all queries (0 = no limit)")
+    p.add_argument("--no-http2", action="store_true", help="Use HTTP/1.1 only (e.g. behind proxies that mishandle h2)")
     args = p.parse_args()
 
     if not args.api_key:
         raise SystemExit("Missing --api-key (or set CHEESE_API_KEY env var).")
 
-    headers = {"X-API-Key": args.api_key, "accept": "application/json"}
-
-    if args.overwrite and os.path.exists(args.out):
-        os.remove(args.out)
-
-    processed = load_processed_query_ids(args.out) if args.resume else set()
-
-    wrote_header = False
-    file_exists = os.path.exists(args.out)
-    if file_exists and not args.overwrite:
-        wrote_header = True
-
-    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
-    with open(args.out, "a", encoding="utf-8", newline="") as f_out:
-        writer = csv.writer(f_out)
-        wrote_header = write_csv_header_if_needed(writer, wrote_header)
-
-        for qid, smiles in iter_input_csv(args.input_csv, args.smiles_col, args.id_col):
-            if args.resume and qid in processed:
-                print(f"[SKIP] query_id={qid} already in output")
-                continue
+    if not args.no_http2:
+        try:
+            import h2  # noqa: F401  (httpx needs it for http2=True)
+        except ImportError:
+            raise SystemExit('HTTP/2 needs the h2 package: pip install "httpx[http2]" (or pass --no-http2).')
 
-            print(f"[RUN] query_id={qid} | smiles={smiles}")
+    headers = {"X-API-Key": args.api_key, "accept": "application/json", "Accept-Encoding": "gzip, deflate"}
 
-            try:
-                hits = process_one_query(
-                    api_url=args.api_url,
-                    headers=headers,
-                    query_id=qid,
-                    smiles=smiles,
-                    db_name=args.db_name,
-                    n=args.n,
-                    page_size=args.page_size,
-                    poll_sec=args.poll_sec,
-                    max_wait_sec=args.max_wait_sec,
-                    include_properties=args.include_properties,
-                    include_metadata=args.include_metadata,
-                    db_name_as_list=args.db_name_as_list,
-                    timeout=args.timeout,
-                )
-            except Exception as e:
-                print(f"[ERROR] query_id={qid} failed: {e}")
-                continue
+    if args.overwrite:
+        for path in (args.out, done_index_path(args.out)):
+            if os.path.exists(path):
+                os.remove(path)
 
-            for hit_smiles, hit_id, sim in hits:
-                writer.writerow([qid, smiles, hit_smiles, hit_id, sim])
+    processed = load_processed_query_ids(args.out) if args.resume else set()
 
-            f_out.flush()
-            processed.add(qid)
-            print(f"[OK] query_id={qid} hits={len(hits)} -> appended")
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    asyncio.run(_run(args, headers, processed))
 
     print(f"[DONE] Output written to: {args.out}")
 